@@ -4,13 +4,12 @@ import os
 import tempfile
 
 from dotenv import load_dotenv
-from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 from langchain_community.llms.ollama import Ollama
 
 from src.config import GREEN, RESET_COLOR, WHITE
 from src.file_processing import clone_github_repo, load_and_index_files
-from src.questions import QuestionContext, ask_question
+from src.questions import QuestionContext, ask_question, compact_conversation_history
 from src.utils import format_user_question
 
 load_dotenv()
@@ -34,7 +33,7 @@ def main():
     print("Cloning the repository...")
     with tempfile.TemporaryDirectory() as local_path:
         if clone_github_repo(github_url, local_path):
-            index, documents, file_type_counts, filenames = load_and_index_files(
+            index, contents, file_type_counts, filenames = load_and_index_files(
                 local_path
             )
             if index is None:
@@ -72,13 +71,14 @@ def main():
                 ],
             )
 
-            llm_chain = LLMChain(prompt=prompt, llm=llm)
+            llm_chain = prompt | llm
 
-            conversation_history = ""
+            conversation_history = []
             question_context = QuestionContext(
                 index,
-                documents,
+                contents,
                 llm_chain,
+                llm,
                 os.getenv("OLLAMA_MODEL"),
                 repo_name,
                 github_url,
@@ -99,11 +99,13 @@ def main():
                     print("Thinking...")
                     user_question = format_user_question(user_question)
 
+                    print(GREEN + "\nANSWER")
                     answer = ask_question(user_question, question_context)
-                    print(GREEN + "\nANSWER\n" + answer + RESET_COLOR + "\n")
-                    conversation_history += (
-                        f"Question: {user_question}\nAnswer: {answer}\n"
+                    print(RESET_COLOR + "\n")
+                    conversation_history.append(
+                        f"Question: {user_question}\nAnswer: {answer}"
                     )
+                    compact_conversation_history(question_context)
                 except Exception as e:
                     print(f"An error occurred: {e}")
                     break
@@ -1,5 +1,14 @@
 """Configuration variables for the project."""
 
+import os
+
 WHITE = "\033[37m"
 GREEN = "\033[32m"
 RESET_COLOR = "\033[0m"
+
+CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "git-llm-analyzer", "cache.sqlite3"
+)
+
+# Total size of cached tokens and indexes before least recently used entries are pruned
+CACHE_MAX_BYTES = 512 * 1024 * 1024
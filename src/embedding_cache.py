@@ -0,0 +1,164 @@
+"""Disk-backed cache for tokenized documents and search indexes."""
+
+import os
+import pickle
+import sqlite3
+import time
+
+from src.config import CACHE_MAX_BYTES, CACHE_PATH
+
+# Keys per SELECT, kept below SQLite's limit on bound parameters
+_BATCH_SIZE = 500
+
+
+class EmbeddingCache:
+    """A size-capped SQLite blob store mapping content hashes to pickled values.
+
+    The least recently used entries are pruned once the stored values exceed
+    max_bytes. Any SQLite or filesystem error disables the cache, so callers
+    carry on as if every lookup missed.
+
+    Attributes:
+        path: The path of the SQLite database file.
+        max_bytes: The maximum total size of the stored values.
+        connection: The connection to the SQLite database, or None if the cache is disabled.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        """Initialize an EmbeddingCache object.
+
+        Args:
+            path: The path of the SQLite database file, created if missing.
+            max_bytes: The maximum total size of the stored values.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.connection = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.connection = sqlite3.connect(path)
+            with self.connection:
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS entries "
+                    "(key TEXT PRIMARY KEY, value BLOB, accessed REAL)"
+                )
+        except (OSError, sqlite3.Error) as e:
+            self._disable(e)
+
+    def get(self, key):
+        """Get a cached value.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            The cached value, or None if the key is not cached.
+        """
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """Get several cached values, marking them as recently used.
+
+        Args:
+            keys (list): The cache keys.
+
+        Returns:
+            dict: A mapping of the cached keys to their values; missing keys are omitted.
+        """
+        if self.connection is None:
+            return {}
+
+        values = {}
+        try:
+            for start in range(0, len(keys), _BATCH_SIZE):
+                end = start + _BATCH_SIZE
+                batch = keys[start:end]
+                rows = self.connection.execute(
+                    "SELECT key, value FROM entries WHERE key IN ({})".format(
+                        ",".join("?" * len(batch))
+                    ),
+                    batch,
+                ).fetchall()
+                for key, value in rows:
+                    try:
+                        values[key] = pickle.loads(value)
+                    except (
+                        pickle.UnpicklingError,
+                        AttributeError,
+                        EOFError,
+                        ImportError,
+                        IndexError,
+                        TypeError,
+                        ValueError,
+                    ):
+                        # Corrupt entries, or ones pickled by other library versions, are misses
+                        continue
+
+            if values:
+                now = time.time()
+                with self.connection:
+                    self.connection.executemany(
+                        "UPDATE entries SET accessed = ? WHERE key = ?",
+                        [(now, key) for key in values],
+                    )
+        except sqlite3.Error as e:
+            self._disable(e)
+            return {}
+        return values
+
+    def set(self, key, value):
+        """Cache a value.
+
+        Args:
+            key (str): The cache key.
+            value: The value to cache, which must be picklable.
+        """
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        """Cache several values in a single transaction, then prune the cache.
+
+        Args:
+            items (dict): A mapping of cache keys to picklable values.
+        """
+        if self.connection is None:
+            return
+
+        now = time.time()
+        try:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO entries (key, value, accessed) VALUES (?, ?, ?)",
+                    [(key, pickle.dumps(value), now) for key, value in items.items()],
+                )
+                self._prune()
+        except sqlite3.Error as e:
+            self._disable(e)
+
+    def _prune(self):
+        """Delete the least recently used entries beyond max_bytes."""
+        self.connection.execute(
+            """
+            DELETE FROM entries WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(LENGTH(value)) OVER (
+                        ORDER BY accessed DESC, key
+                    ) AS total
+                    FROM entries
+                )
+                WHERE total > ?
+            )
+            """,
+            (self.max_bytes,),
+        )
+
+    def _disable(self, error):
+        """Disable the cache after an error, closing its connection."""
+        print(f"Disk cache disabled: {error}")
+        self.close()
+
+    def close(self):
+        """Close the connection to the SQLite database."""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -1,16 +1,21 @@
 """Functions for cloning GitHub repositories, loading and indexing files, and searching documents based on user queries."""
 
+import hashlib
+import mmap
 import os
 import subprocess
-import uuid
+from concurrent.futures import ThreadPoolExecutor
 
+import bm25s
+from joblib import Parallel, delayed
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import DirectoryLoader, NotebookLoader
-from rank_bm25 import BM25Okapi
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from langchain_community.document_loaders import NotebookLoader
 
-from src.utils import clean_and_tokenize
+from src.embedding_cache import EmbeddingCache
+from src.utils import TOKENIZER_VERSION, clean_and_tokenize, tokenize_query
+
+# Files larger than this many bytes are memory-mapped when read
+MMAP_THRESHOLD = 1 << 20
 
 
 def clone_github_repo(github_url, local_path):
@@ -31,6 +36,57 @@ def clone_github_repo(github_url, local_path):
         return False
 
 
+def read_text_file(file_path):
+    """Read a text file, memory-mapping large files.
+
+    Files above MMAP_THRESHOLD are decoded straight from a read-only memory map,
+    so the kernel pages them in on demand instead of buffering a full copy.
+
+    Args:
+        file_path (str): The path of the file to read.
+
+    Returns:
+        str: The content of the file, with undecodable bytes replaced.
+    """
+    if os.path.getsize(file_path) > MMAP_THRESHOLD:
+        with open(file_path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as m:
+            return str(m, "utf-8", "replace")
+
+    with open(file_path, encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def tokenize_documents(contents, document_hashes, cache):
+    """Tokenize documents, reusing cached tokens for unchanged content.
+
+    Args:
+        contents (list): The text of the documents to tokenize.
+        document_hashes (list): The SHA-256 hashes of the documents' content.
+        cache (EmbeddingCache): The cache of previously tokenized documents.
+
+    Returns:
+        list: A list of token lists, one per document.
+    """
+    keys = [f"tokens:{TOKENIZER_VERSION}:{h}" for h in document_hashes]
+    cached_tokens = cache.get_many(keys)
+    tokenized_documents = [cached_tokens.get(key) for key in keys]
+    misses = [i for i, tokens in enumerate(tokenized_documents) if tokens is None]
+
+    if misses:
+        # Tokenization is CPU-bound Python, so fan out across processes for
+        # large batches; small ones are not worth the worker start-up cost
+        n_jobs = -1 if len(misses) >= 256 else 1
+        new_tokens = Parallel(n_jobs=n_jobs, backend="loky", batch_size=64)(
+            delayed(clean_and_tokenize)(contents[i]) for i in misses
+        )
+        for i, tokens in zip(misses, new_tokens):
+            tokenized_documents[i] = tokens
+        cache.set_many({keys[i]: tokenized_documents[i] for i in misses})
+    return tokenized_documents
+
+
 def load_and_index_files(repo_path):
     """Load and index files from a specified repository path.
 
@@ -38,7 +94,8 @@ def load_and_index_files(repo_path):
         repo_path (str): The path to the repository.
 
     Returns:
-        tuple: A tuple containing the index, split documents, file type counts, and filenames.
+        tuple: A tuple containing the index, the text of each chunk, file type counts, and the
+            source filename of each chunk.
     """
     extensions = [
         "txt",
@@ -76,101 +133,107 @@ def load_and_index_files(repo_path):
         "ipynb",
     ]
 
-    file_type_counts = {}
-    documents_dict = {}
-
-    for ext in extensions:
-        glob_pattern = f"**/*.{ext}"
+    # Walk the repository once and group files by extension
+    ext_set = set(extensions)
+    paths_by_ext = {}
+    for root, dirs, files in os.walk(repo_path):
+        # Skip hidden directories such as .git, and walk in a stable order
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for filename in sorted(files):
+            if "." not in filename:
+                continue
+            ext = filename.rsplit(".", 1)[-1].lower()
+            if ext in ext_set:
+                paths_by_ext.setdefault(ext, []).append(os.path.join(root, filename))
+
+    def _load_file(ext_and_path):
+        ext, file_path = ext_and_path
         try:
-            loader = None
             if ext == "ipynb":
                 loader = NotebookLoader(
-                    str(repo_path),
+                    file_path,
                     include_outputs=True,
                     max_output_length=20,
                     remove_newline=True,
                 )
-            else:
-                loader = DirectoryLoader(repo_path, glob=glob_pattern)
-
-            loaded_documents = loader.load() if callable(loader.load) else []
-            if loaded_documents:
-                file_type_counts[ext] = len(loaded_documents)
-                for doc in loaded_documents:
-                    file_path = doc.metadata["source"]
-                    relative_path = os.path.relpath(file_path, repo_path)
-                    file_id = str(uuid.uuid4())
-                    doc.metadata["source"] = relative_path
-                    doc.metadata["file_id"] = file_id
-
-                    documents_dict[file_id] = doc
+                return [doc.page_content for doc in loader.load()]
+            return [read_text_file(file_path)]
         except Exception as e:
-            print(f"Error loading files with pattern '{glob_pattern}': {e}")
-            continue
+            print(f"Error loading file '{file_path}': {e}")
+            return []
+
+    # Only extensions present in the repository contribute files, in extension order
+    ext_file_paths = [
+        (ext, file_path)
+        for ext in extensions
+        for file_path in paths_by_ext.get(ext, [])
+    ]
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=3000, chunk_overlap=200)
+    # File reads are I/O-bound, so load individual files concurrently
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(16, len(ext_file_paths)))
+    ) as executor:
+        results = list(executor.map(_load_file, ext_file_paths))
 
-    split_documents = []
-    for _file_id, original_doc in documents_dict.items():
-        split_docs = text_splitter.split_documents([original_doc])
-        for split_doc in split_docs:
-            split_doc.metadata["file_id"] = original_doc.metadata["file_id"]
-            split_doc.metadata["source"] = original_doc.metadata["source"]
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=3000, chunk_overlap=200)
 
-        split_documents.extend(split_docs)
+    # Keep chunks as parallel arrays of text and source path
+    file_type_counts = {}
+    contents = []
+    filenames = []
+
+    for (ext, file_path), loaded_contents in zip(ext_file_paths, results):
+        if loaded_contents:
+            file_type_counts[ext] = file_type_counts.get(ext, 0) + len(loaded_contents)
+            relative_path = os.path.relpath(file_path, repo_path)
+            for content in loaded_contents:
+                for chunk in text_splitter.split_text(content):
+                    contents.append(chunk)
+                    filenames.append(relative_path)
 
     index = None
-    if split_documents:
-        tokenized_documents = [
-            clean_and_tokenize(doc.page_content) for doc in split_documents
+    if contents:
+        document_hashes = [
+            hashlib.sha256(content.encode()).hexdigest() for content in contents
         ]
-        index = BM25Okapi(tokenized_documents)
-    return (
-        index,
-        split_documents,
-        file_type_counts,
-        [doc.metadata["source"] for doc in split_documents],
-    )
+        # The index is positional, so its key depends on the document order, and
+        # pickles are tied to the bm25s version that wrote them
+        index_key = "bm25s:{}:{}:{}".format(
+            bm25s.__version__,
+            TOKENIZER_VERSION,
+            hashlib.sha256("".join(document_hashes).encode()).hexdigest(),
+        )
+        cache = EmbeddingCache()
+        try:
+            index = cache.get(index_key)
+            if index is None:
+                tokenized_documents = tokenize_documents(
+                    contents, document_hashes, cache
+                )
+                index = bm25s.BM25()
+                index.index(tokenized_documents, show_progress=False)
+                cache.set(index_key, index)
+        finally:
+            cache.close()
+    return index, contents, file_type_counts, filenames
 
 
-def search_documents(query, index, documents, n_results=5):
-    """Search documents based on a query using BM25 and TF-IDF Cosine Similarity.
+def search_documents(query, index, contents, n_results=5):
+    """Search documents based on a query using BM25.
 
     Args:
         query (str): The user's query.
         index: The BM25 index.
-        documents: The list of documents.
+        contents (list): The text of each indexed chunk.
         n_results (int): The number of results to return.
 
     Returns:
-        list: A list of top-ranked documents based on the query.
+        list: The indices of the top-ranked chunks based on the query.
     """
-    query_tokens = clean_and_tokenize(query)
-    bm25_scores = index.get_scores(query_tokens)
-
-    # Compute TF-IDF scores
-    tfidf_vectorizer = TfidfVectorizer(
-        tokenizer=clean_and_tokenize,
-        lowercase=True,
-        stop_words="english",
-        use_idf=True,
-        smooth_idf=True,
-        sublinear_tf=True,
-    )
-    tfidf_matrix = tfidf_vectorizer.fit_transform(
-        [doc.page_content for doc in documents]
+    query_tokens = list(tokenize_query(query))
+    k = min(n_results, len(contents))
+    top_document_indices, _scores = index.retrieve(
+        [query_tokens], k=k, show_progress=False
     )
-    query_tfidf = tfidf_vectorizer.transform([query])
-
-    # Compute Cosine Similarity scores
-    cosine_sim_scores = cosine_similarity(query_tfidf, tfidf_matrix).flatten()
-
-    # Combine BM25 and Cosine Similarity scores
-    combined_scores = bm25_scores * 0.5 + cosine_sim_scores * 0.5
-
-    # Get unique top documents
-    unique_top_document_indices = list(
-        set(combined_scores.argsort()[::-1])  # noqa: C415
-    )[:n_results]
 
-    return [documents[i] for i in unique_top_document_indices]
+    return top_document_indices[0].tolist()
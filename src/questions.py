@@ -1,29 +1,165 @@
 """This module provides a class for representing the context of asking questions about a GitHub repository."""
 
+import hashlib
+import os
+from collections import OrderedDict, deque
+
+import numpy as np
+from langchain.prompts import PromptTemplate
+
 from src.file_processing import search_documents
 from src.utils import format_documents
 
+# Most question and answer turns passed verbatim to the model; beyond this, all
+# but the last HISTORY_TURNS_KEPT are folded into the summary in a single call
+MAX_HISTORY_TURNS = 7
+
+# Most recent question and answer turns kept verbatim when the history is summarized
+HISTORY_TURNS_KEPT = 4
+
+# Number of formatted document sets kept for repeated retrievals
+MAX_FORMATTED_DOCUMENTS = 64
+
+SUMMARY_PROMPT = PromptTemplate.from_template(
+    """
+    Summarize this conversation about a code repository in a few sentences.
+    Keep names of files, functions and facts that later questions may refer to.
+
+    {conversation}
+
+    Summary:
+    """
+)
+
+
+class SemanticCache:
+    """A bounded LRU cache of answers keyed by the embedding of the question.
+
+    A cached answer is returned when a new question is semantically similar to
+    a previous one asked within the same context, which skips the language model call.
+
+    Attributes:
+        model_name: The name of the sentence-transformers model used for embeddings.
+        threshold: The minimum cosine similarity for a cache hit.
+        entries: The cached (embedding, answer, context hash) tuples, least recently used first.
+        enabled: Whether the embedding model is usable; cleared after a load or encode failure.
+    """
+
+    def __init__(self, model_name="all-MiniLM-L6-v2", threshold=0.95, maxsize=128):
+        """Initialize a SemanticCache object.
+
+        Args:
+            model_name: The name of the sentence-transformers model used for embeddings.
+            threshold: The minimum cosine similarity for a cache hit.
+            maxsize: The maximum number of cached answers.
+        """
+        self.model_name = model_name
+        self.threshold = threshold
+        self.entries = deque(maxlen=maxsize)
+        self.enabled = True
+        self._model = None
+        self._emb_matrix = None
+
+    @property
+    def emb_matrix(self):
+        """np.ndarray: The L2-normalized float32 embeddings of the cached questions."""
+        if self._emb_matrix is None:
+            self._emb_matrix = np.stack([entry[0] for entry in self.entries])
+        return self._emb_matrix
+
+    def encode(self, question):
+        """Embed a question, loading the embedding model on first use.
+
+        The cache is disabled if the model cannot be loaded or used, for example
+        when offline, so questions still go to the language model.
+
+        Args:
+            question (str): The user's question.
+
+        Returns:
+            np.ndarray: The L2-normalized float32 embedding of the question, or None if the cache is disabled.
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            if self._model is None:
+                # Imported lazily, as sentence-transformers pulls in torch
+                from sentence_transformers import SentenceTransformer
+
+                self._model = SentenceTransformer(self.model_name)
+            return self._model.encode(question, normalize_embeddings=True).astype(
+                np.float32
+            )
+        except Exception as e:
+            print(f"Semantic cache disabled, failed to embed the question: {e}")
+            self.enabled = False
+            return None
+
+    def get(self, q_emb, context_hash):
+        """Look up a cached answer for a question embedding.
+
+        Args:
+            q_emb (np.ndarray): The embedding of the question.
+            context_hash (str): The hash of the context the question is asked in.
+
+        Returns:
+            str: The cached answer, or None if there is no similar question in the same context.
+        """
+        if not self.entries:
+            return None
+
+        sims = self.emb_matrix @ q_emb
+        sims[[entry[2] != context_hash for entry in self.entries]] = -np.inf
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+
+        # Mark the entry as most recently used
+        entry = self.entries[best]
+        del self.entries[best]
+        self.entries.append(entry)
+        self._emb_matrix = None
+        return entry[1]
+
+    def put(self, q_emb, answer, context_hash):
+        """Cache an answer, evicting the least recently used one when full.
+
+        Args:
+            q_emb (np.ndarray): The embedding of the question.
+            answer (str): The answer to the question.
+            context_hash (str): The hash of the context the question was asked in.
+        """
+        self.entries.append((q_emb, answer, context_hash))
+        self._emb_matrix = None
+
 
 class QuestionContext:
     """A class representing the context for asking questions about a GitHub repository.
 
     Attributes:
         index: The index used for searching documents.
-        documents: The list of documents in the repository.
+        contents: The text of each document chunk in the repository.
         llm_chain: The language model chain for answering questions.
+        llm: The language model, used directly to summarize older conversation turns.
         model_name: The name of the language model used.
         repo_name: The name of the GitHub repository.
         github_url: The URL of the GitHub repository.
-        conversation_history: History of the conversation.
+        conversation_history: List of previous question and answer turns.
+        history_summary: Summary of the turns dropped from the conversation history.
         file_type_counts: Counts of different file types in the repository.
-        filenames: List of filenames in the repository.
+        filenames: The source filename of each document chunk.
+        basenames: The base name of the source file of each document chunk.
+        semantic_cache: Cache of previous answers keyed by question embedding.
+        formatted_documents: LRU cache of formatted documents keyed by the retrieved chunk indices.
     """
 
     def __init__(
         self,
         index,
-        documents,
+        contents,
         llm_chain,
+        llm,
         model_name,
         repo_name,
         github_url,
@@ -35,29 +171,85 @@ class QuestionContext:
 
         Args:
             index: The index used for searching documents.
-            documents: The list of documents in the repository.
+            contents: The text of each document chunk in the repository.
             llm_chain: The language model chain for answering questions.
+            llm: The language model, used directly to summarize older conversation turns.
             model_name: The name of the language model used.
             repo_name: The name of the GitHub repository.
             github_url: The URL of the GitHub repository.
-            conversation_history: History of the conversation.
+            conversation_history: List of previous question and answer turns.
             file_type_counts: Counts of different file types in the repository.
-            filenames: List of filenames in the repository.
+            filenames: The source filename of each document chunk.
         """
         self.index = index
-        self.documents = documents
+        self.contents = contents
         self.llm_chain = llm_chain
+        self.llm = llm
         self.model_name = model_name
         self.repo_name = repo_name
         self.github_url = github_url
         self.conversation_history = conversation_history
+        self.history_summary = ""
         self.file_type_counts = file_type_counts
         self.filenames = filenames
+        self.basenames = [os.path.basename(filename) for filename in filenames]
+        self.semantic_cache = SemanticCache()
+        self.formatted_documents = OrderedDict()
+
+
+def format_relevant_documents(indices, context: QuestionContext):
+    """Format retrieved documents, reusing the result when the same documents are retrieved again.
+
+    Args:
+        indices (list): The indices of the retrieved document chunks, in rank order.
+        context (QuestionContext): The context holding the documents and the cache.
+
+    Returns:
+        str: A formatted string representing the documents.
+    """
+    key = tuple(indices)
+    if key in context.formatted_documents:
+        context.formatted_documents.move_to_end(key)
+        return context.formatted_documents[key]
+
+    numbered_documents = format_documents(indices, context.contents, context.basenames)
+    context.formatted_documents[key] = numbered_documents
+    if len(context.formatted_documents) > MAX_FORMATTED_DOCUMENTS:
+        context.formatted_documents.popitem(last=False)
+    return numbered_documents
+
+
+def compact_conversation_history(context: QuestionContext):
+    """Fold conversation turns beyond the most recent ones into a summary.
+
+    Once the history exceeds MAX_HISTORY_TURNS, the turns older than the last
+    HISTORY_TURNS_KEPT are summarized together with the previous summary in a
+    single call and removed from the conversation history in place. If the
+    summary call fails, the older turns are dropped without being summarized.
+
+    Args:
+        context (QuestionContext): The context holding the conversation history.
+    """
+    if len(context.conversation_history) <= MAX_HISTORY_TURNS:
+        return
+
+    older_turns = context.conversation_history[:-HISTORY_TURNS_KEPT]
+    if context.history_summary:
+        older_turns.insert(0, f"Summary: {context.history_summary}")
+    try:
+        context.history_summary = context.llm.invoke(
+            SUMMARY_PROMPT.format(conversation="\n".join(older_turns))
+        ).strip()
+    except Exception as e:
+        print(f"Failed to summarize the conversation history: {e}")
+    del context.conversation_history[:-HISTORY_TURNS_KEPT]
 
 
 def ask_question(question, context: QuestionContext):
     """Ask a question about a GitHub repository and obtain an answer using a language model chain.
 
+    The answer is printed as it is streamed from the language model chain.
+
     Args:
         question (str): The user's question.
         context (QuestionContext): The context for asking the question.
@@ -65,25 +257,47 @@ def ask_question(question, context: QuestionContext):
     Returns:
         str: The answer to the user's question obtained from the language model chain.
     """
-    relevant_docs = search_documents(
-        question, context.index, context.documents, n_results=5
+    history_parts = list(context.conversation_history)
+    if context.history_summary:
+        history_parts.insert(0, f"Summary: {context.history_summary}")
+    conversation_history = "\n".join(history_parts)
+    # Cached answers are only reused for the same conversation as the prompt sees it
+    context_hash = hashlib.sha256(
+        f"{context.repo_name}\n{conversation_history}".encode()
+    ).hexdigest()
+    q_emb = context.semantic_cache.encode(question)
+    cached_answer = None
+    if q_emb is not None:
+        cached_answer = context.semantic_cache.get(q_emb, context_hash)
+    if cached_answer is not None:
+        print(cached_answer, end="", flush=True)
+        return cached_answer
+
+    relevant_indices = search_documents(
+        question, context.index, context.contents, n_results=5
     )
 
-    numbered_documents = format_documents(relevant_docs)
+    numbered_documents = format_relevant_documents(relevant_indices, context)
     question_context = f"This question is about the GitHub repository '{context.repo_name}' available at {context.github_url}. The most relevant documents are:\n\n{numbered_documents}"
 
-    answer_with_sources = context.llm_chain.invoke(
-        input={
+    chunks = []
+    for chunk in context.llm_chain.stream(
+        {
             "model": context.model_name,
             "question": question,
             "context": question_context,
             "repo_name": context.repo_name,
             "github_url": context.github_url,
-            "conversation_history": context.conversation_history,
+            "conversation_history": conversation_history,
             "numbered_documents": numbered_documents,
             "file_type_counts": context.file_type_counts,
             "filenames": context.filenames,
-            "return_only_outputs": True,
         }
-    )
-    return answer_with_sources["text"]
+    ):
+        print(chunk, end="", flush=True)
+        chunks.append(chunk)
+
+    answer = "".join(chunks)
+    if q_emb is not None:
+        context.semantic_cache.put(q_emb, answer, context_hash)
+    return answer
@@ -1,19 +1,22 @@
 """Utility functions for text processing and formatting."""
 
-import os
+import functools
 import re
 
-import nltk
+# Bump whenever clean_and_tokenize changes so cached tokens are invalidated
+TOKENIZER_VERSION = "3"
 
-nltk.download("punkt")
+# HTML tags, bracketed and parenthesized text, URLs and digits
+_RE_COMBINED = re.compile(r"<[^>]*>|\[.*?\]|\(.*?\)|\b(?:http|ftp)s?://\S+|\d+")
+_RE_NONWORD = re.compile(r"\W+")
 
 
 def clean_and_tokenize(text):
     """Clean and tokenize the input text.
 
     This function performs various cleaning steps on the input text, such as
-    removing HTML tags, special characters, URLs, and digits. It then tokenizes
-    the cleaned text into words.
+    removing HTML tags, special characters, URLs, and digits. It then splits
+    the cleaned text into words on whitespace.
 
     Args:
         text (str): The input text.
@@ -21,33 +24,46 @@ def clean_and_tokenize(text):
     Returns:
         list: A list of tokens representing the cleaned and tokenized text.
     """
-    text = re.sub(r"\s+", " ", text)
-    text = re.sub(r"<[^>]*>", "", text)
-    text = re.sub(r"\[.*?\]", "", text)
-    text = re.sub(r"\(.*?\)", "", text)
-    text = re.sub(r"\b(?:http|ftp)s?://\S+", "", text)
-    text = re.sub(r"\W", " ", text)
-    text = re.sub(r"\d+", "", text)
-    text = text.lower()
-    return nltk.word_tokenize(text)
-
-
-def format_documents(documents):
+    text = _RE_COMBINED.sub(" ", text)
+    text = _RE_NONWORD.sub(" ", text).lower()
+    return text.split()
+
+
+@functools.lru_cache(maxsize=1024)
+def tokenize_query(query):
+    """Clean and tokenize a user's query.
+
+    Results are memoized, since the same queries are often asked repeatedly.
+    Documents are tokenized with clean_and_tokenize so they do not fill the cache.
+
+    Args:
+        query (str): The user's query.
+
+    Returns:
+        tuple: A tuple of tokens representing the cleaned and tokenized query.
+    """
+    return tuple(clean_and_tokenize(query))
+
+
+def format_documents(indices, contents, basenames, max_chars=800):
     """Format a list of documents for display.
 
     This function formats a list of documents by adding numbers and
-    concatenating document names and content.
+    concatenating document names and content, truncated to keep the prompt short.
 
     Args:
-        documents (list): A list of documents.
+        indices (list): The indices of the documents to format.
+        contents (list): The text of each document.
+        basenames (list): The base name of the source file of each document.
+        max_chars (int): The maximum number of characters kept from each document.
 
     Returns:
         str: A formatted string representing the documents.
     """
     numbered_docs = "\n".join(
         [
-            f"{i+1}. {os.path.basename(doc.metadata['source'])}: {doc.page_content}"
-            for i, doc in enumerate(documents)
+            f"{rank+1}. {basenames[i]}: {contents[i][:max_chars]}"
+            for rank, i in enumerate(indices)
         ]
     )
     return numbered_docs